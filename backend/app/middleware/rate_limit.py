@@ -17,7 +17,7 @@ class TokenBucket:
         self.capacity = capacity
         self.tokens = capacity
         self.refill_rate = refill_rate
-        self.last_refill = time.time()
+        self.last_refill = time.monotonic()
         logger.info(
             f"Token Bucket Initialized with capacity: {capacity} | refill_rate: {refill_rate}",
             "MAGENTA",
@@ -32,7 +32,8 @@ class TokenBucket:
         return False
 
     def _refill(self):
-        now = time.time()
+        # Monotonic so NTP/wall-clock jumps can't mint or eat tokens
+        now = time.monotonic()
         elapsed = now - self.last_refill
         self.tokens = min(
             self.capacity, self.tokens + elapsed * self.refill_rate
@@ -106,7 +107,9 @@ class RateLimitMiddleware:
                 data = json.loads(bucket_data)
                 bucket = TokenBucket(data["capacity"], data["refill_rate"])
                 bucket.tokens = data["tokens"]
-                bucket.last_refill = data["last_refill"]
+                # Wall-clock age mapped onto this host's monotonic clock
+                age = max(0.0, time.time() - data["last_refill"])
+                bucket.last_refill = time.monotonic() - age
                 self.buckets[ip] = bucket
 
                 return bucket
@@ -121,11 +124,13 @@ class RateLimitMiddleware:
 
     def _save_bucket(self, ip: str, bucket: TokenBucket):
         try:
+            # Persist wall-clock time so other hosts and restarts can read it
+            last_refill = time.time() - (time.monotonic() - bucket.last_refill)
             bucket_data = {
                 "capacity": bucket.capacity,
                 "tokens": bucket.tokens,
                 "refill_rate": bucket.refill_rate,
-                "last_refill": bucket.last_refill,
+                "last_refill": last_refill,
             }
             self.redis_client.setex(
                 f"rate_limit:{ip}", BUCKET_CLEANUP_FREQ, json.dumps(bucket_data)
@@ -135,7 +140,7 @@ class RateLimitMiddleware:
 
     async def _cleanup_old_buckets(self):
         await asyncio.sleep(BUCKET_CLEANUP_FREQ)
-        current_time = time.time()
+        current_time = time.monotonic()
         expired_ips = []
 
         for ip, bucket in self.buckets.items():
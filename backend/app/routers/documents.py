@@ -1,4 +1,7 @@
-from fastapi import APIRouter, File, Request, Response, UploadFile
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from fastapi import APIRouter, Depends, File, Request, Response, UploadFile
 
 from app.core.config import settings
 from app.schemas.documents import (
@@ -15,11 +18,22 @@ from app.services.document_processing_service import (
 router = APIRouter()
 _file = File(...)
 
+CsvProcessor = Callable[[UploadFile], Awaitable[dict[str, Any]]]
+
+
+def get_csv_processor() -> CsvProcessor:
+    return process_csv_file
+
+
+_csv_processor = Depends(get_csv_processor)
+
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_document(file: UploadFile = _file):
+async def upload_document(
+    file: UploadFile = _file, process_csv: CsvProcessor = _csv_processor
+):
     try:
-        result = await process_csv_file(file)
+        result = await process_csv(file)
         return result
 
     except Exception as e:
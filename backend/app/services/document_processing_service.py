@@ -139,14 +139,18 @@ async def get_symbol_from_name(name: str) -> str | None:
 
         best_match = None
         min_distance = float("inf")
+        target = corrected_name.lower().strip()
 
         for result in company_info:
             symbol = result.get("symbol", "")
             company_name = result.get("description", "")
 
             if symbol and company_name:
+                # Only a strictly closer name matters; stop scoring past that
                 distance = levenshtein_distance(
-                    corrected_name.lower().strip(), company_name.lower().strip()
+                    target,
+                    company_name.lower().strip(),
+                    max_dist=(None if best_match is None else min_distance - 1),
                 )
                 if distance < min_distance:
                     min_distance = distance
@@ -1,16 +1,18 @@
 import asyncio
 import logging
 import os
-import pickle
 import string
-from functools import wraps
+from collections import defaultdict
+from functools import lru_cache, wraps
 from typing import Literal
 
 import httpx
+import numpy as np
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from pybktree import BKTree
 from pybloom_live import BloomFilter
+from rapidfuzz import process
+from rapidfuzz.distance import DamerauLevenshtein
 
 
 load_dotenv()
@@ -28,7 +30,7 @@ MAX_RETRIES = 3  # Number of times to hit the 3rd party API before yielding
 REQUEST_PER_MINUTE = 30
 CACHE_TTL = 300  # s 5 minutes
 MAX_CACHE_CAPACITY = 1000
-DIST_THRESH = 3  # Edit distance boundary for bk-tree to select candidates
+DIST_THRESH = 3  # Edit distance boundary for typo candidates
 
 LOG_COLORS = {
     "RED": "\033[31m",
@@ -203,48 +205,19 @@ def is_valid(text: str):
     return False
 
 
-def levenshtein_distance(s1: str, s2: str) -> int:
+def levenshtein_distance(s1: str, s2: str, max_dist: int | None = None) -> int:
     """
     Damerau-Levenshtein distance: minimum edits (insertions, deletions,
     substitutions, and transpositions) to convert one string to another.
+
+    With max_dist, gives up early and returns max_dist + 1 once the
+    distance is known to exceed it. A negative max_dist is treated as 0.
     """
-    len1, len2 = len(s1), len(s2)
-
-    h = {}
-    for char in s1 + s2:
-        if char not in h:
-            h[char] = 0
-
-    maxdist = len1 + len2
-    H = [[maxdist for _ in range(len2 + 2)] for _ in range(len1 + 2)]
-
-    H[0][0] = maxdist
-    for i in range(0, len1 + 1):
-        H[i + 1][0] = maxdist
-        H[i + 1][1] = i
-    for j in range(0, len2 + 1):
-        H[0][j + 1] = maxdist
-        H[1][j + 1] = j
-
-    for i in range(1, len1 + 1):
-        db = 0
-        for j in range(1, len2 + 1):
-            k = h[s2[j - 1]]
-            l = db
-            if s1[i - 1] == s2[j - 1]:
-                cost = 0
-                db = j
-            else:
-                cost = 1
-            H[i + 1][j + 1] = min(
-                H[i][j] + cost,
-                H[i + 1][j] + 1,
-                H[i][j + 1] + 1,
-                H[k][l] + (i - k - 1) + 1 + (j - l - 1),
-            )
-        h[s1[i - 1]] = i
-
-    return H[len1 + 1][len2 + 1]
+    if max_dist is not None:
+        max_dist = max(max_dist, 0)
+
+    # rapidfuzz runs the same unrestricted metric in native code
+    return DamerauLevenshtein.distance(s1, s2, score_cutoff=max_dist)
 
 
 #######################################################
@@ -252,6 +225,9 @@ def levenshtein_distance(s1: str, s2: str) -> int:
 #######################################################
 
 
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+
 class Corpus:
     def __init__(self, file_dir: str = "data"):
 
@@ -270,8 +246,7 @@ class Corpus:
         if not name:
             return ""
 
-        translator = str.maketrans("", "", string.punctuation)
-        normalized = name.lower().strip().translate(translator)
+        normalized = name.lower().strip().translate(PUNCTUATION_TABLE)
         normalized = " ".join(normalized.split())
 
         return normalized
@@ -339,29 +314,30 @@ class TypoChecker:
         filepath: str = "data/company.txt",
         dist_thresh: float = DIST_THRESH,
     ):
-        self.bk_tree = None
         self.bloom_filter = None
         self.map = {}
-        self.bk_tree_file = "data/bk_tree.pkl"
+        self.keys = []
+        self.by_len = {}
         self.dist_thresh = dist_thresh
 
         self._load_corpus(filepath)
 
-        if not self._load_from_cache():
-            self._build_tree()
-            self._save_to_cache()
-
     @staticmethod
     def _normalize_concatenate(name: str) -> str | None:
         if not name:
             return ""
 
-        translator = str.maketrans("", "", string.punctuation)
-        normalized = name.lower().strip().translate(translator)
+        normalized = name.lower().strip().translate(PUNCTUATION_TABLE)
         normalized = "".join(normalized.split())
 
         return normalized
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _normalize_query(query: str) -> str | None:
+        # Cached separately so loading the corpus doesn't flood the cache
+        return TypoChecker._normalize_concatenate(query)
+
     def _load_corpus(self, filepath: str):
         companies = Corpus.load_corpus(filepath)
         capacity = max(100_000, len(companies))
@@ -373,76 +349,65 @@ class TypoChecker:
             self.bloom_filter.add(concatenated)
             self.map[concatenated] = company
 
-        logger.info(f"Loaded {len(companies)} companies into spell checker")
-
-    def _load_from_cache(self) -> bool:
-
-        if os.path.exists(self.bk_tree_file):
-            try:
-                with open(self.bk_tree_file, "rb") as f:
-                    self.bk_tree = pickle.load(f)
-                logger.info("BK-tree loaded from cache")
-                return True
-            except Exception as e:
-                logger.error(f"Failed to load from cache: {e}")
-                return False
-        return False
-
-    def _save_to_cache(self):
-
-        try:
-            with open(self.bk_tree_file, "wb") as f:
-                pickle.dump(self.bk_tree, f)
-            logger.info("BK-tree saved to cache")
-        except Exception as e:
-            logger.error(f"Failed to save to cache: {e}")
-
-    def clear_cache(self):
+        # Fixed candidate order for the vectorized distance sweep
+        self.keys = list(self.map)
 
-        if os.path.exists(self.bk_tree_file):
-            os.remove(self.bk_tree_file)
-
-        logger.info("Cache file cleared")
-
-    def _build_tree(self):
-        if not self.map:
-            logger.info("Corpus not loaded")
-            return
+        # Edit distance is at least the length gap, so bucket by length
+        buckets = defaultdict(list)
+        for i, key in enumerate(self.keys):
+            buckets[len(key)].append(i)
+        self.by_len = {n: np.array(idx) for n, idx in buckets.items()}
 
-        self.bk_tree = BKTree(levenshtein_distance)
-        for key in self.map.keys():
-            self.bk_tree.add(key)
+        logger.info(f"Loaded {len(companies)} companies into spell checker")
 
     def requires_check(
         self, query: str, max_suggestions=5
     ) -> list[tuple[str, int]]:
 
-        modified_query = self._normalize_concatenate(query)
+        modified_query = self._normalize_query(query)
 
         if self.bloom_filter and (modified_query in self.bloom_filter):
             logger.info("Query found. Not proceeding with the check", "BLUE")
             return []
 
         logger.info(f"Typo in {query}", "BRIGHT_YELLOW")
-        if self.bk_tree and len(self.map) > 0:
-            candidates = list(
-                self.bk_tree.find(modified_query, n=self.dist_thresh)
-            )
-            if not candidates:
-                return []
-
-            suggestions = []
-            for distance, name in candidates:
-                original_name = self.map.get(name, name)
-                suggestions.append((original_name, distance))
-
-            suggestions.sort(key=lambda x: x[1])
+        if not self.keys:
+            return []
 
-            sliced_suggestions = suggestions[:max_suggestions]
-            logger.info(f"Suggestions: {sliced_suggestions}", "BRIGHT_YELLOW")
-            return sliced_suggestions
+        # Only keys within cutoff of the query length can match; sorting
+        # keeps corpus order so ties rank the same as a full sweep
+        cutoff = int(self.dist_thresh)
+        size = len(modified_query)
+        buckets = [
+            self.by_len[n]
+            for n in range(max(0, size - cutoff), size + cutoff + 1)
+            if n in self.by_len
+        ]
+        if not buckets:
+            return []
+        candidates = np.sort(np.concatenate(buckets))
+
+        # One native sweep over the candidates; misses come back as
+        # cutoff + 1, so only in-range candidates survive the mask and
+        # the scores fit in int8
+        distances = process.cdist(
+            [modified_query],
+            [self.keys[i] for i in candidates],
+            scorer=DamerauLevenshtein.distance,
+            score_cutoff=cutoff,
+            dtype=np.int8,
+        )[0]
+        hits = np.flatnonzero(distances <= cutoff)
+        if not hits.size:
+            return []
 
-        return []
+        nearest = hits[np.argsort(distances[hits], kind="stable")]
+        sliced_suggestions = [
+            (self.map[self.keys[candidates[i]]], int(distances[i]))
+            for i in nearest[:max_suggestions]
+        ]
+        logger.info(f"Suggestions: {sliced_suggestions}", "BRIGHT_YELLOW")
+        return sliced_suggestions
 
 
 # Build corpus if it doesnt exist
@@ -0,0 +1,106 @@
+from types import MappingProxyType
+
+import httpx
+import numpy as np
+import requests
+
+
+_NETWORK_ERRORS = (
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+)
+
+
+class PerformanceMetrics:
+    def __init__(
+        self,
+        capacity: int | None = None,
+        parent: "PerformanceMetrics | None" = None,
+    ):
+        self.parent = parent
+        self.response_times_ns = np.zeros(capacity or 64, dtype=np.int64)
+        self.status_codes = np.zeros(capacity or 64, dtype=np.int16)
+        self.errors = []
+        self.network_errors = 0
+        self._count = 0
+        self._stats = None
+
+    def add_result_at(
+        self,
+        index,
+        response_time_ns,
+        status_code,
+        error: BaseException | None = None,
+    ):
+        if index >= len(self.response_times_ns):
+            # Only unsized pools (e.g. suite_metrics) reach this; double it
+            size = max(index + 1, 2 * len(self.response_times_ns))
+            self.response_times_ns = np.resize(self.response_times_ns, size)
+            self.status_codes = np.resize(self.status_codes, size)
+        self.response_times_ns[index] = response_time_ns
+        self.status_codes[index] = status_code
+        self._count = max(self._count, index + 1)
+        self._stats = None
+
+        if error is not None:
+            self.errors.append(repr(error))
+            if isinstance(error, _NETWORK_ERRORS):
+                self.network_errors += 1
+
+        if self.parent is not None:
+            self.parent.add_result(response_time_ns, status_code, error)
+
+    def add_result(
+        self,
+        response_time_ns,
+        status_code,
+        error: BaseException | None = None,
+    ):
+        self.add_result_at(self._count, response_time_ns, status_code, error)
+
+    def get_stats(self):
+        # Cached until the next sample lands; read-only so callers can share it
+        if self._stats is not None:
+            return self._stats
+        if not self._count:
+            return {}
+
+        total = self._count
+        codes = self.status_codes[:total]
+        times = self.response_times_ns[:total]
+        # One pass over the codes; 0 marks a request that never got a response
+        counts = np.bincount(codes, minlength=600)
+        successful = int(counts[200] + counts[201])
+        rate_limited = int(counts[429])
+        client_errors = int(counts[400:500].sum())
+        server_errors = int(counts[500:].sum())
+        # One introselect for every order statistic; "lower" percentile ranks
+        last = total - 1
+        p50, p90, p95, p99 = (last * q // 100 for q in (50, 90, 95, 99))
+        mid_lo, mid_hi = last // 2, total // 2
+        ranked = np.partition(
+            times, sorted({0, mid_lo, mid_hi, p50, p90, p95, p99, last})
+        )
+        self._stats = MappingProxyType(
+            {
+                "total_requests": total,
+                "successful_requests": successful,
+                "rate_limited_requests": rate_limited,
+                "client_errors": client_errors,
+                "server_errors": server_errors,
+                "network_errors": self.network_errors,
+                "min_latency_ms": ranked[0] * 1e-6,
+                "max_latency_ms": ranked[last] * 1e-6,
+                "mean_latency_ms": times.mean() * 1e-6,
+                "median_latency_ms": (ranked[mid_lo] + ranked[mid_hi]) * 5e-7,
+                "p50_latency_ms": ranked[p50] * 1e-6,
+                "p90_latency_ms": ranked[p90] * 1e-6,
+                "p95_latency_ms": ranked[p95] * 1e-6,
+                "p99_latency_ms": ranked[p99] * 1e-6,
+                "success_rate": successful / total * 100,
+                "availability": (total - self.network_errors) / total * 100,
+            }
+        )
+        return self._stats
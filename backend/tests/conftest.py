@@ -0,0 +1,52 @@
+import os
+
+import pytest
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.utils import setup_logger
+from tests._perf_metrics import PerformanceMetrics
+
+
+NGROK_TUNNEL_URL = os.getenv("NGROK_TUNNEL_URL")
+
+logger = setup_logger(__name__)
+
+
+@pytest.fixture
+def base_url():
+    # Without a tunnel every request would fail fast and record fake timings
+    if not NGROK_TUNNEL_URL:
+        pytest.skip("NGROK_TUNNEL_URL not set")
+    return NGROK_TUNNEL_URL
+
+
+@pytest.fixture(scope="session")
+def session():
+    # One pool per xdist worker, wide enough for the largest thread fan-out
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    yield session
+    session.close()
+
+
+@pytest.fixture(scope="session")
+def suite_metrics():
+    # Pools every timed request so the tail percentiles have enough samples
+    metrics = PerformanceMetrics()
+    yield metrics
+
+    stats = metrics.get_stats()
+    if not stats:
+        return
+    logger.info(
+        f"Suite Requests: {stats['total_requests']}\n"
+        f"Suite Success Rate: {stats['success_rate']:.1f}%\n"
+        f"Suite P50 Latency: {stats['p50_latency_ms']:.2f}ms\n"
+        f"Suite P90 Latency: {stats['p90_latency_ms']:.2f}ms\n"
+        f"Suite P95 Latency: {stats['p95_latency_ms']:.2f}ms\n"
+        f"Suite P99 Latency: {stats['p99_latency_ms']:.2f}ms",
+        "MAGENTA",
+    )
@@ -1,41 +1,69 @@
+import asyncio
 import concurrent.futures
-import os
-import statistics
+import json
 import time
 
+import httpx
 import pytest
 import requests
-from fastapi.testclient import TestClient
 
 from app.main import app
 from app.utils import setup_logger
+from tests._perf_metrics import PerformanceMetrics
 
 
-NGROK_TUNNEL_URL = os.getenv("NGROK_TUNNEL_URL")
+LOOKUP_BODY = json.dumps(
+    {
+        "data": [
+            {"name": "Apple Inc.", "symbol": "", "shares": 100},
+            {"name": "", "symbol": "MSFT", "shares": 50},
+        ]
+    }
+).encode()
+CSV_BYTES = b"name,symbol,shares,price\nApple Inc.,AAPL,100,150.00\nGoogle Inc.,GOOGL,50,2500.00"
 
 logger = setup_logger(__name__)
 
 
-def clear_rate_limits(base_url: str, headers: dict):
+def clear_rate_limits(session: requests.Session, base_url: str, headers: dict):
+    # Short fail-fast probe; a hung reset must not stall the measurements
     try:
-        response = requests.post(
+        response = session.post(
             f"{base_url}/api/v1/documents/_private/rl/reset",
             headers=headers,
-            timeout=10,
+            timeout=(1, 2),
         )
-        if response.status_code == 200:
-            logger.info("Rate limits cleared successfully", "GREEN")
-        else:
-            logger.warning(
-                f"Failed to clear rate limits: {response.status_code}", "YELLOW"
-            )
+    except requests.exceptions.Timeout:
+        return
     except Exception as e:
         logger.warning(f"Error clearing rate limits: {e}", "YELLOW")
+        return
 
+    if response.status_code == 200:
+        logger.info("Rate limits cleared successfully", "GREEN")
+    else:
+        logger.warning(
+            f"Failed to clear rate limits: {response.status_code}", "YELLOW"
+        )
 
-@pytest.fixture
-def base_url():
-    return NGROK_TUNNEL_URL
+
+def _run_n(n: int, fn, metrics: PerformanceMetrics, workers: int = 4):
+    # A few workers keep the run short while staying under the rate limit
+    now = time.perf_counter_ns
+
+    def timed(_):
+        start = now()
+        try:
+            status_code = fn().status_code
+            error = None
+        except requests.exceptions.RequestException as e:
+            status_code = 0
+            error = e
+        return now() - start, status_code, error
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for index, result in enumerate(executor.map(timed, range(n))):
+            metrics.add_result_at(index, *result)
 
 
 @pytest.fixture
@@ -46,270 +74,174 @@ def headers():
     }
 
 
-class PerformanceMetrics:
-    def __init__(self):
-        self.response_times = []
-        self.status_codes = []
-        self.errors = []
-        self.network_errors = 0
-
-    def add_result(self, response_time, status_code, error=None):
-        self.response_times.append(response_time)
-        self.status_codes.append(status_code)
-        if error:
-            self.errors.append(error)
-            if (
-                "network" in str(error).lower()
-                or "timeout" in str(error).lower()
-            ):
-                self.network_errors += 1
-
-    def get_stats(self):
-        if not self.response_times:
-            return {}
-
-        sorted_times = sorted(self.response_times)
-        return {
-            "total_requests": len(self.response_times),
-            "successful_requests": sum(
-                1 for code in self.status_codes if code == 200 or code == 201
-            ),
-            "rate_limited_requests": sum(
-                1 for code in self.status_codes if code == 429
-            ),
-            "client_errors": sum(
-                1 for code in self.status_codes if 400 <= code < 500
-            ),
-            "server_errors": sum(
-                1 for code in self.status_codes if code >= 500
-            ),
-            "network_errors": self.network_errors,
-            "min_latency_ms": min(self.response_times) * 1000,
-            "max_latency_ms": max(self.response_times) * 1000,
-            "mean_latency_ms": statistics.mean(self.response_times) * 1000,
-            "median_latency_ms": statistics.median(self.response_times) * 1000,
-            "p50_latency_ms": self._percentile(sorted_times, 50) * 1000,
-            "p90_latency_ms": self._percentile(sorted_times, 90) * 1000,
-            "p95_latency_ms": self._percentile(sorted_times, 95) * 1000,
-            "p99_latency_ms": self._percentile(sorted_times, 99) * 1000,
-            "success_rate": (
-                sum(
-                    1
-                    for code in self.status_codes
-                    if code == 200 or code == 201
-                )
-                / len(self.status_codes)
-            )
-            * 100,
-            "availability": (
-                (len(self.status_codes) - self.network_errors)
-                / len(self.status_codes)
-            )
-            * 100,
-        }
-
-    def _percentile(self, sorted_times, percentile):
-        if not sorted_times:
-            return 0
-        index = int((percentile / 100) * len(sorted_times))
-        if index >= len(sorted_times):
-            return sorted_times[-1]
-        return sorted_times[index]
-
-
 class TestPerformance:
-    def test_latency_metrics(self, base_url, headers):
-        metrics = PerformanceMetrics()
-        clear_rate_limits(base_url, headers)
+    def test_latency_metrics(self, session, suite_metrics, base_url, headers):
+        metrics = PerformanceMetrics(capacity=30, parent=suite_metrics)
+        clear_rate_limits(session, base_url, headers)
 
-        for _ in range(30):
-            start_time = time.time()
-            try:
-                response = requests.get(
-                    f"{base_url}/", headers=headers, timeout=30
-                )
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, response.status_code)
-            except requests.exceptions.RequestException as e:
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, 0, str(e))
+        def request():
+            return session.get(f"{base_url}/", headers=headers, timeout=30)
+
+        _run_n(30, request, metrics)
 
         stats = metrics.get_stats()
 
-        logger.info(f"Total Requests: {stats['total_requests']}", "GREEN")
-        logger.info(f"Success Rate: {stats['success_rate']:.1f}%", "GREEN")
-        logger.info(f"Availability: {stats['availability']:.1f}%", "GREEN")
-        logger.info(f"P50 Latency: {stats['p50_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P90 Latency: {stats['p90_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P95 Latency: {stats['p95_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P99 Latency: {stats['p99_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"Mean Latency: {stats['mean_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"Network Errors: {stats['network_errors']}", "YELLOW")
+        logger.info(
+            f"Total Requests: {stats['total_requests']}\n"
+            f"Success Rate: {stats['success_rate']:.1f}%\n"
+            f"Availability: {stats['availability']:.1f}%\n"
+            f"P50 Latency: {stats['p50_latency_ms']:.2f}ms\n"
+            f"P90 Latency: {stats['p90_latency_ms']:.2f}ms\n"
+            f"P95 Latency: {stats['p95_latency_ms']:.2f}ms\n"
+            f"P99 Latency: {stats['p99_latency_ms']:.2f}ms\n"
+            f"Mean Latency: {stats['mean_latency_ms']:.2f}ms\n"
+            f"Network Errors: {stats['network_errors']}",
+            "GREEN",
+        )
 
         assert stats["total_requests"] == 30
         assert stats["availability"] > 50
 
-    def test_upload_metrics(self, base_url, headers):
-        metrics = PerformanceMetrics()
-        csv_data = "name,symbol,shares,price\nApple Inc.,AAPL,100,150.00\nGoogle Inc.,GOOGL,50,2500.00"
-        clear_rate_limits(base_url, headers)
+    def test_upload_metrics(self, session, suite_metrics, base_url, headers):
+        metrics = PerformanceMetrics(capacity=15, parent=suite_metrics)
+        clear_rate_limits(session, base_url, headers)
 
-        for _ in range(15):
-            import io
+        def request():
+            return session.post(
+                f"{base_url}/api/v1/documents/upload",
+                files={"file": ("test.csv", CSV_BYTES, "text/csv")},
+                headers={"ngrok-skip-browser-warning": "true"},
+                timeout=60,
+            )
 
-            files = {"file": ("test.csv", io.StringIO(csv_data), "text/csv")}
-
-            start_time = time.time()
-            try:
-                response = requests.post(
-                    f"{base_url}/api/v1/documents/upload",
-                    files=files,
-                    headers={"ngrok-skip-browser-warning": "true"},
-                    timeout=60,
-                )
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, response.status_code)
-            except requests.exceptions.RequestException as e:
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, 0, str(e))
+        _run_n(15, request, metrics)
 
         stats = metrics.get_stats()
 
-        logger.info(f"Success Rate: {stats['success_rate']:.1f}%", "GREEN")
-        logger.info(f"P50 Upload Time: {stats['p50_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P99 Upload Time: {stats['p99_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"Max Upload Time: {stats['max_latency_ms']:.2f}ms", "BLUE")
+        logger.info(
+            f"Success Rate: {stats['success_rate']:.1f}%\n"
+            f"P50 Upload Time: {stats['p50_latency_ms']:.2f}ms\n"
+            f"P99 Upload Time: {stats['p99_latency_ms']:.2f}ms\n"
+            f"Max Upload Time: {stats['max_latency_ms']:.2f}ms",
+            "GREEN",
+        )
 
         assert stats["total_requests"] == 15
 
-    def test_throughput_metrics(self, base_url, headers):
-        metrics = PerformanceMetrics()
-        clear_rate_limits(base_url, headers)
+    async def test_throughput_metrics(
+        self, session, suite_metrics, base_url, headers
+    ):
+        metrics = PerformanceMetrics(capacity=50, parent=suite_metrics)
+        clear_rate_limits(session, base_url, headers)
 
-        def make_web_request():
-            start_time = time.time()
+        async def make_web_request(client: httpx.AsyncClient):
+            start_time = time.perf_counter_ns()
             try:
-                response = requests.get(
+                response = await client.get(
                     f"{base_url}/", headers=headers, timeout=20
                 )
-                end_time = time.time()
+                end_time = time.perf_counter_ns()
                 return end_time - start_time, response.status_code, None
-            except requests.exceptions.RequestException as e:
-                end_time = time.time()
-                return end_time - start_time, 0, str(e)
+            except httpx.HTTPError as e:
+                end_time = time.perf_counter_ns()
+                return end_time - start_time, 0, e
 
-        start_test = time.time()
+        start_test = time.perf_counter()
         workers = 8
         queries = 50
 
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=workers
-        ) as executor:
-            futures = [
-                executor.submit(make_web_request) for _ in range(queries)
-            ]
-            results = [
-                future.result()
-                for future in concurrent.futures.as_completed(futures)
-            ]
+        limits = httpx.Limits(max_connections=workers)
+        async with httpx.AsyncClient(limits=limits) as client:
+            results = await asyncio.gather(
+                *[make_web_request(client) for _ in range(queries)]
+            )
 
-        end_test = time.time()
+        end_test = time.perf_counter()
 
-        for response_time, status_code, error in results:
-            metrics.add_result(response_time, status_code, error)
+        for index, result in enumerate(results):
+            metrics.add_result_at(index, *result)
 
         stats = metrics.get_stats()
         total_time = end_test - start_test
         throughput = stats["total_requests"] / total_time
 
-        logger.info(f"Total Time: {total_time:.2f}s", "GREEN")
         logger.info(
-            f"RPS (throughput): {throughput:.2f}  \nWorkers: {workers} \nRequests: {queries}",
+            f"Total Time: {total_time:.2f}s\n"
+            f"RPS (throughput): {throughput:.2f}  \nWorkers: {workers} \nRequests: {queries}\n"
+            f"Successful Requests: {stats['successful_requests']}\n"
+            f"Rate Limited: {stats['rate_limited_requests']}\n"
+            f"Network Errors: {stats['network_errors']}\n"
+            f"P50 Latency: {stats['p50_latency_ms']:.2f}ms\n"
+            f"P99 Latency: {stats['p99_latency_ms']:.2f}ms",
             "GREEN",
         )
-        logger.info(
-            f"Successful Requests: {stats['successful_requests']}", "GREEN"
-        )
-        logger.info(f"Rate Limited: {stats['rate_limited_requests']}", "GREEN")
-        logger.info(f"Network Errors: {stats['network_errors']}", "YELLOW")
-        logger.info(f"P50 Latency: {stats['p50_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P99 Latency: {stats['p99_latency_ms']:.2f}ms", "BLUE")
         assert stats["total_requests"] == queries
         assert throughput > 0
 
-    def test_lookup_performance_metrics(self, base_url, headers):
-        metrics = PerformanceMetrics()
-        clear_rate_limits(base_url, headers)
+    def test_lookup_performance_metrics(
+        self, session, suite_metrics, base_url, headers
+    ):
+        metrics = PerformanceMetrics(capacity=10, parent=suite_metrics)
+        clear_rate_limits(session, base_url, headers)
+
+        def request():
+            return session.post(
+                f"{base_url}/api/v1/documents/lookup/full",
+                data=LOOKUP_BODY,
+                headers=headers,
+                timeout=120,
+            )
 
-        test_data = {
-            "data": [
-                {"name": "Apple Inc.", "symbol": "", "shares": 100},
-                {"name": "", "symbol": "MSFT", "shares": 50},
-            ]
-        }
-
-        for _ in range(10):
-            start_time = time.time()
-            try:
-                response = requests.post(
-                    f"{base_url}/api/v1/documents/lookup/full",
-                    json=test_data,
-                    headers=headers,
-                    timeout=120,
-                )
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, response.status_code)
-            except requests.exceptions.RequestException as e:
-                end_time = time.time()
-                metrics.add_result(end_time - start_time, 0, str(e))
+        _run_n(10, request, metrics)
 
         stats = metrics.get_stats()
 
-        logger.info(f"Success Rate: {stats['success_rate']:.1f}%", "GREEN")
-        logger.info(f"Rate Limited: {stats['rate_limited_requests']}", "YELLOW")
-        logger.info(f"P50 Lookup Time: {stats['p50_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P95 Lookup Time: {stats['p95_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"P99 Lookup Time: {stats['p99_latency_ms']:.2f}ms", "BLUE")
-        logger.info(f"Max Lookup Time: {stats['max_latency_ms']:.2f}ms", "BLUE")
+        logger.info(
+            f"Success Rate: {stats['success_rate']:.1f}%\n"
+            f"Rate Limited: {stats['rate_limited_requests']}\n"
+            f"P50 Lookup Time: {stats['p50_latency_ms']:.2f}ms\n"
+            f"P95 Lookup Time: {stats['p95_latency_ms']:.2f}ms\n"
+            f"P99 Lookup Time: {stats['p99_latency_ms']:.2f}ms\n"
+            f"Max Lookup Time: {stats['max_latency_ms']:.2f}ms",
+            "GREEN",
+        )
 
         assert stats["total_requests"] == 10
 
-    def test_stressed_rl(self, base_url, headers):
-        clear_rate_limits(base_url, headers)
-        metrics = PerformanceMetrics()
+    async def test_stressed_rl(self, session, base_url, headers):
+        clear_rate_limits(session, base_url, headers)
+        # Deliberate 429s would skew the suite_metrics tail percentiles
+        metrics = PerformanceMetrics(capacity=60)
 
-        def make_request():
-            start_time = time.time()
+        async def make_request(client: httpx.AsyncClient):
+            start_time = time.perf_counter_ns()
             try:
-                response = requests.get(
+                response = await client.get(
                     f"{base_url}/", headers=headers, timeout=15
                 )
-                end_time = time.time()
+                end_time = time.perf_counter_ns()
                 return end_time - start_time, response.status_code, None
-            except requests.exceptions.RequestException as e:
-                end_time = time.time()
-                return end_time - start_time, 0, str(e)
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            futures = [executor.submit(make_request) for _ in range(60)]
-            results = [
-                future.result()
-                for future in concurrent.futures.as_completed(futures)
-            ]
+            except httpx.HTTPError as e:
+                end_time = time.perf_counter_ns()
+                return end_time - start_time, 0, e
+
+        limits = httpx.Limits(max_connections=20)
+        async with httpx.AsyncClient(limits=limits) as client:
+            results = await asyncio.gather(
+                *[make_request(client) for _ in range(60)]
+            )
 
-        for response_time, status_code, error in results:
-            metrics.add_result(response_time, status_code, error)
+        for index, result in enumerate(results):
+            metrics.add_result_at(index, *result)
 
         stats = metrics.get_stats()
 
-        logger.info(f"Total Requests: {stats['total_requests']}", "GREEN")
-        logger.info(f"Successful: {stats['successful_requests']}", "GREEN")
         logger.info(
-            f"Rate Limiting Effectiveness: {(stats['rate_limited_requests']/stats['total_requests'])*100:.1f}%",
-            "MAGENTA",
-        )
-        logger.info(
-            f"Average Response Time: {stats['mean_latency_ms']:.2f}ms", "BLUE"
+            f"Total Requests: {stats['total_requests']}\n"
+            f"Successful: {stats['successful_requests']}\n"
+            f"Rate Limiting Effectiveness: {(stats['rate_limited_requests']/stats['total_requests'])*100:.1f}%\n"
+            f"Average Response Time: {stats['mean_latency_ms']:.2f}ms",
+            "GREEN",
         )
 
         assert stats["total_requests"] == 60
@@ -318,64 +250,51 @@ class TestPerformance:
             or stats["successful_requests"] > 0
         )
 
-    def test_throughput_metrics_local(self):
-        client = TestClient(app)
-        metrics = PerformanceMetrics()
+    async def test_throughput_metrics_local(self):
+        # In-process timings would skew the tunnel suite_metrics pool
+        metrics = PerformanceMetrics(capacity=50)
 
-        def make_local_request():
-            start_time = time.time()
+        async def make_local_request(client: httpx.AsyncClient):
+            start_time = time.perf_counter_ns()
             try:
-                response = client.get("/")
-                end_time = time.time()
+                response = await client.get("/")
+                end_time = time.perf_counter_ns()
                 return end_time - start_time, response.status_code, None
             except Exception as e:
-                end_time = time.time()
-                return end_time - start_time, 0, str(e)
+                end_time = time.perf_counter_ns()
+                return end_time - start_time, 0, e
 
-        start_test = time.time()
-        workers = 8
+        start_test = time.perf_counter()
         queries = 50
 
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=workers
-        ) as executor:
-            futures = [
-                executor.submit(make_local_request) for _ in range(queries)
-            ]
-            results = [
-                future.result()
-                for future in concurrent.futures.as_completed(futures)
-            ]
+        # One event loop drives the ASGI app directly; threads only add
+        # contention since TestClient funnels through a single loop anyway
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://testserver"
+        ) as client:
+            results = await asyncio.gather(
+                *[make_local_request(client) for _ in range(queries)]
+            )
 
-        end_test = time.time()
+        end_test = time.perf_counter()
 
-        for response_time, status_code, error in results:
-            metrics.add_result(response_time, status_code, error)
+        for index, result in enumerate(results):
+            metrics.add_result_at(index, *result)
 
         stats = metrics.get_stats()
         total_time = end_test - start_test
         throughput = stats["total_requests"] / total_time
 
-        logger.info(f"Local Total Time: {total_time:.2f}s", "GREEN")
         logger.info(
-            f"Local RPS (throughput): {throughput:.2f}  \nWorkers: {workers} \nRequests: {queries}",
+            f"Local Total Time: {total_time:.2f}s\n"
+            f"Local RPS (throughput): {throughput:.2f}  \nRequests: {queries}\n"
+            f"Local Successful Requests: {stats['successful_requests']}\n"
+            f"Local Rate Limited: {stats['rate_limited_requests']}\n"
+            f"Local Network Errors: {stats['network_errors']}\n"
+            f"Local P50 Latency: {stats['p50_latency_ms']:.2f}ms\n"
+            f"Local P99 Latency: {stats['p99_latency_ms']:.2f}ms",
             "GREEN",
         )
-        logger.info(
-            f"Local Successful Requests: {stats['successful_requests']}",
-            "GREEN",
-        )
-        logger.info(
-            f"Local Rate Limited: {stats['rate_limited_requests']}", "GREEN"
-        )
-        logger.info(
-            f"Local Network Errors: {stats['network_errors']}", "YELLOW"
-        )
-        logger.info(
-            f"Local P50 Latency: {stats['p50_latency_ms']:.2f}ms", "BLUE"
-        )
-        logger.info(
-            f"Local P99 Latency: {stats['p99_latency_ms']:.2f}ms", "BLUE"
-        )
         assert stats["total_requests"] == queries
         assert throughput > 0
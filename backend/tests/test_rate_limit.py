@@ -0,0 +1,76 @@
+import pytest
+
+from app.middleware.rate_limit import RateLimitMiddleware, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Virtual monotonic clock; tests advance it instead of sleeping
+    now = [1000.0]
+    monkeypatch.setattr(
+        "app.middleware.rate_limit.time.monotonic", lambda: now[0]
+    )
+    return now
+
+
+@pytest.fixture
+def wall_clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("app.middleware.rate_limit.time.time", lambda: now[0])
+    return now
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+class TestTokenBucket:
+    def test_consume_until_empty(self, clock):
+        bucket = TokenBucket(capacity=3, refill_rate=1.0)
+
+        assert all(bucket.consume() for _ in range(3))
+        assert not bucket.consume()
+
+    def test_token_refill(self, clock):
+        bucket = TokenBucket(capacity=2, refill_rate=10.0)
+        assert bucket.consume(2)
+        assert not bucket.consume()
+
+        clock[0] += 0.1
+        assert bucket.consume()
+        assert not bucket.consume()
+
+    def test_refill_capped_at_capacity(self, clock):
+        bucket = TokenBucket(capacity=2, refill_rate=10.0)
+
+        clock[0] += 60
+        assert bucket.consume(2)
+        assert not bucket.consume()
+
+
+class TestBucketPersistence:
+    def test_save_restore_across_hosts(self, clock, wall_clock):
+        redis_client = FakeRedis()
+        saver = RateLimitMiddleware(requests_per_minute=60)
+        saver.redis_client = redis_client
+
+        bucket = saver._get_or_create_bucket("1.2.3.4")
+        assert bucket.consume(60)
+        saver._save_bucket("1.2.3.4", bucket)
+
+        # Another replica: unrelated monotonic origin, 10s of wall time later
+        clock[0] = 5.0
+        wall_clock[0] += 10
+        loader = RateLimitMiddleware(requests_per_minute=60)
+        loader.redis_client = redis_client
+
+        restored = loader._get_or_create_bucket("1.2.3.4")
+        assert restored.consume(10)
+        assert not restored.consume()
@@ -1,87 +1,108 @@
+from functools import lru_cache
+
 import pytest
 
-from app.utils import setup_logger, typo_checker
+from app.utils import levenshtein_distance, setup_logger, typo_checker
 
 
 logger = setup_logger(__name__)
 
 
+@lru_cache(maxsize=4096)
+def _cached_check(typo: str) -> tuple:
+    # Typos repeat across the batch, parametrized and accuracy tests
+    return tuple(typo_checker.requires_check(typo))
+
+
+# (original, typo, expected_found)
+TYPO_CASES = [
+    ("bank of the james financial", "ank of the james financial", True),
+    ("west holdings corp", "wst holdings corp", True),
+    ("robert half inc", "robert alf inc", True),
+    ("xcel energy inc", "xce energy inc", True),
+    ("berry corp", "bery corp", True),
+    (
+        "bank of the james financial",
+        "bankk of the james financial",
+        True,
+    ),
+    ("west holdings corp", "wesst holdings corp", True),
+    ("robert half inc", "robert halff inc", True),
+    ("xcel energy inc", "xcel energyy inc", True),
+    ("berry corp", "berryy corp", True),
+    (
+        "bank of the james financial",
+        "bonk of the james financial",
+        True,
+    ),
+    ("west holdings corp", "wost holdings corp", True),
+    ("robert half inc", "robert holf inc", True),
+    ("xcel energy inc", "xcel energe inc", True),
+    ("berry corp", "barry corp", True),
+    (
+        "bank of the james financial",
+        "abnk of the james financial",
+        True,
+    ),
+    ("west holdings corp", "ewst holdings corp", True),
+    ("robert half inc", "robert hlaf inc", True),
+    (
+        "xcel energy inc",
+        "xccel energy inc",
+        True,
+    ),
+    ("berry corp", "beryr corp", True),
+    ("bank of the james financial", "bak of te james financial", True),
+    ("west holdings corp", "wst holdin corp", True),
+    ("robert half inc", "robet haf inc", True),
+    ("xcel energy inc", "xl enrgy inc", True),
+    ("berry corp", "bery cop", True),
+    (
+        "bank of the james financial",
+        "bank f the james financial",
+        True,
+    ),
+    (
+        "west holdings corp",
+        "west holding corp",
+        True,
+    ),
+    ("robert half inc", "robt haf inc", True),
+    (
+        "xcel energy inc",
+        "xcl engy inc",
+        True,
+    ),
+    ("berry corp", "bery co", True),
+    (
+        "bank of the james financial",
+        "bk of t james financial",
+        False,
+    ),
+    ("west holdings corp", "ws holdi corp", False),
+    ("robert half inc", "robt ha inc", False),
+    ("xcel energy inc", "xl engy inc", False),
+    ("berry corp", "ber co", False),
+]
+
+
 class TestTypoVariations:
 
-    @pytest.mark.parametrize(
-        "original,typo,expected_found",
-        [
-            ("bank of the james financial", "ank of the james financial", True),
-            ("west holdings corp", "wst holdings corp", True),
-            ("robert half inc", "robert alf inc", True),
-            ("xcel energy inc", "xce energy inc", True),
-            ("berry corp", "bery corp", True),
-            (
-                "bank of the james financial",
-                "bankk of the james financial",
-                True,
-            ),
-            ("west holdings corp", "wesst holdings corp", True),
-            ("robert half inc", "robert halff inc", True),
-            ("xcel energy inc", "xcel energyy inc", True),
-            ("berry corp", "berryy corp", True),
-            (
-                "bank of the james financial",
-                "bonk of the james financial",
-                True,
-            ),
-            ("west holdings corp", "wost holdings corp", True),
-            ("robert half inc", "robert holf inc", True),
-            ("xcel energy inc", "xcel energe inc", True),
-            ("berry corp", "barry corp", True),
-            (
-                "bank of the james financial",
-                "abnk of the james financial",
-                True,
-            ),
-            ("west holdings corp", "ewst holdings corp", True),
-            ("robert half inc", "robert hlaf inc", True),
-            (
-                "xcel energy inc",
-                "xccel energy inc",
-                True,
-            ),
-            ("berry corp", "beryr corp", True),
-            ("bank of the james financial", "bak of te james financial", True),
-            ("west holdings corp", "wst holdin corp", True),
-            ("robert half inc", "robet haf inc", True),
-            ("xcel energy inc", "xl enrgy inc", True),
-            ("berry corp", "bery cop", True),
-            (
-                "bank of the james financial",
-                "bank f the james financial",
-                True,
-            ),
-            (
-                "west holdings corp",
-                "west holding corp",
-                True,
-            ),
-            ("robert half inc", "robt haf inc", True),
-            (
-                "xcel energy inc",
-                "xcl engy inc",
-                True,
-            ),
-            ("berry corp", "bery co", True),
-            (
-                "bank of the james financial",
-                "bk of t james financial",
-                False,
-            ),
-            ("west holdings corp", "ws holdi corp", False),
-            ("robert half inc", "robt ha inc", False),
-            ("xcel energy inc", "xl engy inc", False),
-            ("berry corp", "ber co", False),
-        ],
-    )
+    def test_character_modifications_batch(self):
+        # Same cases as below in one test; the parametrized run is for triage
+        failures = []
+        for original, typo, expected_found in TYPO_CASES:
+            suggestions = _cached_check(typo)
+            suggestion_names = [s[0] for s in suggestions]
+            if (original in suggestion_names) != expected_found:
+                failures.append((original, typo, expected_found))
+
+        assert not failures, f"Unexpected suggestion results: {failures}"
+
+    @pytest.mark.slow
+    @pytest.mark.parametrize("original,typo,expected_found", TYPO_CASES)
     def test_character_modifications(self, original, typo, expected_found):
-        suggestions = typo_checker.requires_check(typo)
+        suggestions = _cached_check(typo)
 
         if expected_found:
             assert (
@@ -136,7 +157,7 @@ class TestTypoVariations:
     )
     def test_typo_variations(self, original, typo_variations):
         for typo in typo_variations:
-            suggestions = typo_checker.requires_check(typo)
+            suggestions = _cached_check(typo)
             assert len(suggestions) > 0, f"No suggestions found for '{typo}'"
 
             suggestion_names = [s[0] for s in suggestions]
@@ -167,7 +188,7 @@ class TestTypoAccuracy:
         no_suggestions = 0
 
         for correct_name, typo in test_pairs:
-            suggestions = typo_checker.requires_check(typo)
+            suggestions = _cached_check(typo)
 
             if not suggestions:
                 no_suggestions += 1
@@ -184,3 +205,46 @@ class TestTypoAccuracy:
         logger.info(f"Correct predictions: {correct_predictions}", "BLUE")
         logger.info(f"No suggestions provided: {no_suggestions}", "BLUE")
         logger.info(f"Accuracy: {accuracy:.2%}", "BLUE")
+
+
+class TestLevenshteinDistance:
+
+    @pytest.mark.parametrize(
+        "s1,s2,expected",
+        [
+            ("", "", 0),
+            ("", "abc", 3),
+            ("berry corp", "berry corp", 0),
+            ("berry corp", "bery corp", 1),
+            ("berry corp", "bery cop", 2),
+            ("abcd", "acbd", 1),
+            ("ca", "abc", 2),
+        ],
+    )
+    def test_distance(self, s1, s2, expected):
+        assert levenshtein_distance(s1, s2) == expected
+        assert levenshtein_distance(s2, s1) == expected
+
+    @pytest.mark.parametrize(
+        "s1,s2,max_dist,expected",
+        [
+            ("berry corp", "bery corp", 3, 1),
+            ("berry corp", "ber co", 3, 4),
+            ("xcel energy inc", "xl engy inc", 3, 4),
+            ("robert half inc", "berry corp", 2, 3),
+            ("abcd", "acbd", 0, 1),
+        ],
+    )
+    def test_max_dist_caps_result(self, s1, s2, max_dist, expected):
+        assert levenshtein_distance(s1, s2, max_dist=max_dist) == expected
+
+    @pytest.mark.parametrize(
+        "s1,s2,expected",
+        [
+            ("berry corp", "berry corp", 0),
+            ("berry corp", "bery corp", 1),
+            ("berry corp", "ber co", 1),
+        ],
+    )
+    def test_negative_max_dist_clamped_to_zero(self, s1, s2, expected):
+        assert levenshtein_distance(s1, s2, max_dist=-3) == expected